@@ -0,0 +1,142 @@
+import subprocess
+import sys
+from os.path import abspath, dirname, join, relpath
+
+# Modules whose start-up cost matters: the package itself, the scoring
+# functions and the lighter entry points. Heavy libraries (sklearn, lightgbm,
+# holidays, tqdm) must only be loaded once a model is fitted or imputed.
+MODULES = [
+    "src",
+    "src.evaluate",
+    "src.error_index",
+    "src.data",
+    "src.preprocessing",
+    "src.forecast_models",
+    "src.tuning",
+    "src.utils",
+]
+ROOT = dirname(dirname(abspath(__file__)))
+
+# Entry points run as scripts; only the imports they trigger are counted
+SCRIPTS = [join(ROOT, "scripts", "scoring_script.py")]
+BUDGET_SECONDS = 1.0
+
+
+def parse_importtime(stderr: str) -> list[tuple[int, str, float]]:
+    """
+    Parse the output of `python -X importtime`.
+
+    Args:
+        stderr (str): Standard error of the interpreter.
+
+    Returns:
+        list: One (depth, module, cumulative seconds) tuple per import, in
+        the order they were reported (children before their parent).
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((depth, name.strip(), int(cumulative) / 1e6))
+    return imports
+
+
+def import_time(module: str) -> tuple[float, list[tuple[str, float]]]:
+    """
+    Measure the import time of a module in a fresh interpreter.
+
+    Args:
+        module (str): Dotted name of the module to import.
+
+    Returns:
+        tuple: The cumulative import time of `module` in seconds, and the
+        cumulative time of each module it imports directly, slowest first.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = parse_importtime(result.stderr)
+
+    position = max(i for i, (_, name, _) in enumerate(imports) if name == module)
+    depth, _, total = imports[position]
+
+    # The block of `module` is the run of deeper imports reported just before it
+    children = []
+    for child_depth, name, seconds in reversed(imports[:position]):
+        if child_depth <= depth:
+            break
+        if child_depth == depth + 1:
+            children.append((name, seconds))
+
+    children.sort(key=lambda child: child[1], reverse=True)
+    return total, children
+
+
+def script_import_time(path: str) -> tuple[float, list[tuple[str, float]]]:
+    """
+    Measure the time a script spends importing, run in a fresh interpreter.
+
+    The script is run through `runpy`, so that the imports of the interpreter
+    start-up, reported before `runpy`, can be told apart from its own.
+
+    Args:
+        path (str): Path of the script.
+
+    Returns:
+        tuple: The total import time of the script in seconds, and the
+        cumulative time of each module it imports, slowest first.
+    """
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            # pkgutil is imported by run_path itself, load it beforehand
+            f"import pkgutil, runpy; runpy.run_path({path!r}, run_name='__main__')",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=ROOT,
+    )
+    imports = parse_importtime(result.stderr)
+
+    start = max(i for i, (_, name, _) in enumerate(imports) if name == "runpy") + 1
+    children = [
+        (name, seconds) for depth, name, seconds in imports[start:] if depth == 0
+    ]
+
+    children.sort(key=lambda child: child[1], reverse=True)
+    return sum(seconds for _, seconds in children), children
+
+
+def main():
+    print(f"{'module':<28}{'import [s]':>12}  slowest dependencies")
+    print("-" * 78)
+    targets = [(module, import_time) for module in MODULES]
+    targets += [(path, script_import_time) for path in SCRIPTS]
+
+    over_budget = []
+    for target, measure in targets:
+        total, packages = measure(target)
+        label = relpath(target, ROOT) if target.endswith(".py") else target
+        slowest = ", ".join(f"{name} {seconds:.2f}" for name, seconds in packages[:3])
+        print(f"{label:<28}{total:>12.3f}  {slowest}")
+        if total > BUDGET_SECONDS:
+            over_budget.append(label)
+
+    if over_budget:
+        print(f"\nOver the {BUDGET_SECONDS:.1f} s budget: {', '.join(over_budget)}")
+        sys.exit(1)
+    print(f"\nAll modules and scripts import in less than {BUDGET_SECONDS:.1f} s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import numpy as np
+import pandas as pd
+
+from src.evaluate import SCORE_WEIGHTS
+
+TIME_GROUPS = ("day", "hour", "weekday")
+METRICS = ("absolute_error", "portfolio_error", "portfolio_attribution")
+
+
+class ErrorIndex:
+    """
+    Signed forecast errors of one country, stored for fast drill-down.
+
+    The errors `pred - true` are kept as a compact (hours x consumers)
+    float32 array, together with precomputed day, hour-of-day and weekday
+    codes of every row and the signed portfolio error of every hour. Queries
+    are then reductions over this array instead of reloading and slicing the
+    forecast frames, and two backtests can be compared with `compare`.
+
+    The portfolio error of an hour is |sum_c e_c|; it is attributed to the
+    consumers as sign(sum_c e_c) * e_c, so that the attributions of a window
+    sum to its portfolio error (all sums are accumulated in float64).
+
+    Example:
+        >>> index = ErrorIndex.from_frames(pred_es, true_es, "ES")
+        >>> index.portfolio_attribution("consumer", start="2024-07-01").head()
+        >>> index.portfolio_attribution(("consumer", "hour"), start="2024-07-01")
+        >>> index.compare(ErrorIndex.load("last_run_es.npz")).head()
+    """
+
+    def __init__(
+        self,
+        errors: np.ndarray,
+        timestamps: pd.DatetimeIndex,
+        consumers: pd.Index,
+        country: str,
+    ):
+        self.errors = np.asarray(errors, dtype=np.float32)
+        self.timestamps = pd.DatetimeIndex(timestamps)
+        self.consumers = pd.Index(consumers)
+        self.country = country
+
+        if country not in SCORE_WEIGHTS:
+            raise ValueError(
+                f"Unknown country '{country}', expected one of {list(SCORE_WEIGHTS)}."
+            )
+        if self.timestamps.tz is not None:
+            raise ValueError(
+                "Timestamps must be timezone naive, use `tz_localize(None)`."
+            )
+        if not self.timestamps.is_monotonic_increasing:
+            raise ValueError("Timestamps must be sorted.")
+        if self.errors.shape != (len(self.timestamps), len(self.consumers)):
+            raise ValueError(
+                f"Errors of shape {self.errors.shape} do not match "
+                f"{len(self.timestamps)} timestamps and "
+                f"{len(self.consumers)} consumers."
+            )
+
+        self.portfolio = self.errors.sum(axis=1, dtype=np.float64)
+        day_codes, days = pd.factorize(self.timestamps.normalize(), sort=True)
+        self.codes = {
+            "day": day_codes,
+            "hour": self.timestamps.hour.to_numpy(),
+            "weekday": self.timestamps.dayofweek.to_numpy(),
+        }
+        self.labels = {
+            "day": pd.Index(days, name="day"),
+            "hour": pd.RangeIndex(24, name="hour"),
+            "weekday": pd.RangeIndex(7, name="weekday"),
+        }
+
+    @classmethod
+    def from_frames(
+        cls, pred: pd.DataFrame, true: pd.DataFrame, country: str
+    ) -> "ErrorIndex":
+        """
+        Build the index of one country from the frames passed to `evaluate`.
+
+        Args:
+            pred (pd.DataFrame): Forecasted consumption, one column per consumer.
+            true (pd.DataFrame): Actual consumption with the same structure.
+            country (str): Either "IT" or "ES".
+
+        Returns:
+            ErrorIndex: The index of the signed errors `pred - true`.
+        """
+        assert np.all(
+            pred.columns == true.columns
+        ), f"Wrong header or header order for {country}"
+        assert np.all(
+            pred.index == true.index
+        ), f"Wrong index or index order for {country}"
+        assert pred.isna().sum().sum() == 0, f"NaN in forecast for {country}"
+
+        errors = pred.to_numpy(dtype=float) - true.to_numpy(dtype=float)
+        return cls(errors, pd.to_datetime(pred.index), pred.columns, country)
+
+    def save(self, path: str) -> None:
+        """Store the index as a compressed `.npz` file."""
+        np.savez_compressed(
+            path,
+            errors=self.errors,
+            timestamps=self.timestamps.to_numpy().astype("datetime64[ns]"),
+            consumers=np.asarray(self.consumers, dtype=str),
+            country=self.country,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "ErrorIndex":
+        """Load an index stored with `save`."""
+        with np.load(path) as data:
+            return cls(
+                data["errors"],
+                pd.DatetimeIndex(data["timestamps"]),
+                pd.Index(data["consumers"]),
+                str(data["country"]),
+            )
+
+    def _rows(self, start, end) -> slice:
+        """Row slice of the window [start, end], both ends included."""
+        first = (
+            0 if start is None else self.timestamps.searchsorted(pd.Timestamp(start))
+        )
+        last = (
+            len(self.timestamps)
+            if end is None
+            else self.timestamps.searchsorted(pd.Timestamp(end), side="right")
+        )
+        return slice(first, last)
+
+    def _group(self, values: np.ndarray, rows: slice, by: str):
+        """Sum per-row values (1d) or per-row, per-consumer values (2d) by `by`."""
+        if by not in TIME_GROUPS:
+            raise ValueError(f"Unknown group '{by}', expected one of {TIME_GROUPS}.")
+        codes = self.codes[by][rows]
+        labels = self.labels[by]
+        present = np.bincount(codes, minlength=len(labels)) > 0
+
+        if values.ndim == 1:
+            sums = np.bincount(codes, weights=values, minlength=len(labels))
+            return pd.Series(sums[present], index=labels[present])
+
+        # float64 one-hot so that the sums accumulate in float64
+        one_hot = np.eye(len(labels), dtype=np.float64)[codes]
+        sums = values.T @ one_hot
+        return pd.DataFrame(
+            sums[:, present], index=self.consumers, columns=labels[present]
+        )
+
+    def _reduce(self, values: np.ndarray, rows: slice, by):
+        """Reduce a (rows x consumers) array to a float, Series or DataFrame."""
+        if by is None:
+            return float(values.sum(dtype=np.float64))
+        if by == "consumer":
+            return pd.Series(values.sum(axis=0, dtype=np.float64), index=self.consumers)
+        if isinstance(by, tuple) and by[0] == "consumer":
+            return self._group(values, rows, by[1])
+        return self._group(values.sum(axis=1, dtype=np.float64), rows, by)
+
+    def absolute_error(self, by=None, start=None, end=None):
+        """
+        Absolute error of the window, optionally broken down.
+
+        Args:
+            by (str | tuple, optional): None for the total, "consumer", one of
+                "day", "hour", "weekday", or ("consumer", <time group>) for a
+                consumers x time-group table. Defaults to None.
+            start, end (optional): Window bounds, both included. Default to
+                the whole index.
+
+        Returns:
+            float | pd.Series | pd.DataFrame: The summed absolute errors.
+        """
+        rows = self._rows(start, end)
+        return self._reduce(np.abs(self.errors[rows]), rows, by)
+
+    def portfolio_error(self, by=None, start=None, end=None):
+        """
+        Portfolio error of the window, optionally broken down by time.
+
+        Args:
+            by (str, optional): None for the total, or one of "day", "hour",
+                "weekday". Use `portfolio_attribution` for consumers.
+            start, end (optional): Window bounds, both included.
+
+        Returns:
+            float | pd.Series: The summed portfolio errors.
+        """
+        if by is not None and by not in TIME_GROUPS:
+            raise ValueError(
+                f"Portfolio error can only be split by {TIME_GROUPS}, "
+                "use `portfolio_attribution` for consumers."
+            )
+        rows = self._rows(start, end)
+        portfolio = np.abs(self.portfolio[rows])
+        if by is None:
+            return float(portfolio.sum())
+        return self._group(portfolio, rows, by)
+
+    def portfolio_attribution(self, by="consumer", start=None, end=None):
+        """
+        Share of the portfolio error driven by each consumer and/or period.
+
+        Positive values push the portfolio error up, negative values offset
+        errors of other consumers. Summing all attributions of the window
+        gives `portfolio_error` of the same window.
+
+        Args:
+            by (str | tuple, optional): Same as in `absolute_error`.
+                Defaults to "consumer".
+            start, end (optional): Window bounds, both included.
+
+        Returns:
+            float | pd.Series | pd.DataFrame: The attributed portfolio error.
+        """
+        rows = self._rows(start, end)
+        sign = np.sign(self.portfolio[rows])
+        if by == "consumer":
+            # Avoid materialising the signed matrix for the common query
+            return pd.Series(sign @ self.errors[rows], index=self.consumers)
+        return self._reduce(self.errors[rows] * sign[:, None], rows, by)
+
+    def score(self, start=None, end=None) -> float:
+        """Official weighted score of the window, as in `weighted_score`."""
+        weights = SCORE_WEIGHTS[self.country]
+        return weights["Absolute Error"] * self.absolute_error(
+            start=start, end=end
+        ) + weights["Portfolio Error"] * self.portfolio_error(start=start, end=end)
+
+    def compare(
+        self,
+        other: "ErrorIndex",
+        metric: str = "portfolio_attribution",
+        by="consumer",
+        start=None,
+        end=None,
+    ) -> pd.DataFrame:
+        """
+        Run-to-run diff of a breakdown, without recomputing any forecast.
+
+        Args:
+            other (ErrorIndex): Index of the run to compare against.
+            metric (str, optional): "absolute_error", "portfolio_error" or
+                "portfolio_attribution". Defaults to "portfolio_attribution".
+            by (str | tuple, optional): Breakdown accepted by the metric:
+                None, "consumer", a time group or ("consumer", <time group>)
+                for "absolute_error" and "portfolio_attribution"; None or a
+                time group for "portfolio_error". Defaults to "consumer".
+            start, end (optional): Window bounds, both included.
+
+        Returns:
+            pd.DataFrame: Columns `this`, `other` and `delta = this - other`,
+            sorted by decreasing absolute delta. Totals (`by=None`) have a
+            single `total` row, consumers x time-group tables are stacked to
+            one row per (consumer, group) pair. Labels missing from one run
+            count as zero.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {METRICS}.")
+
+        def as_series(result) -> pd.Series:
+            if isinstance(result, pd.DataFrame):
+                return result.stack()
+            if isinstance(result, pd.Series):
+                return result
+            return pd.Series([result], index=["total"])
+
+        this = as_series(getattr(self, metric)(by=by, start=start, end=end))
+        that = as_series(getattr(other, metric)(by=by, start=start, end=end))
+        diff = pd.concat([this, that], axis=1, keys=["this", "other"]).fillna(0.0)
+        diff["delta"] = diff["this"] - diff["other"]
+        return diff.reindex(diff["delta"].abs().sort_values(ascending=False).index)
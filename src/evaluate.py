@@ -1,6 +1,71 @@
 import numpy as np
 import pandas as pd
 
+# Official weights of the datathon score, per country and error type
+SCORE_WEIGHTS = {
+    "IT": {"Absolute Error": 1.0, "Portfolio Error": 10.0},
+    "ES": {"Absolute Error": 5.0, "Portfolio Error": 50.0},
+}
+
+
+def country_errors(pred: pd.DataFrame, true: pd.DataFrame) -> tuple[float, float]:
+    """
+    Compute the absolute and portfolio errors of a single country.
+
+    Args:
+        pred (pd.DataFrame): Forecasted consumption, one column per consumer.
+        true (pd.DataFrame): Actual consumption with the same structure.
+
+    Returns:
+        tuple[float, float]: The absolute error (summed over consumers and
+        hours) and the portfolio error (absolute error of the hourly sum).
+    """
+    diff = pred - true
+    abs_err = diff.abs().sum().sum()
+    port_err = diff.sum(axis=1).abs().sum()
+    return abs_err, port_err
+
+
+def weighted_score(pred: pd.DataFrame, true: pd.DataFrame, country: str) -> float:
+    """
+    Compute the official weighted score contribution of a single country.
+
+    Args:
+        pred (pd.DataFrame): Forecasted consumption, one column per consumer.
+        true (pd.DataFrame): Actual consumption with the same structure.
+        country (str): Either "IT" or "ES", selects the weights.
+
+    Returns:
+        float: `w_abs * Absolute Error + w_port * Portfolio Error`, so that
+        the total forecast score is the sum over both countries.
+    """
+    abs_err, port_err = country_errors(pred, true)
+    weights = SCORE_WEIGHTS[country]
+    return weights["Absolute Error"] * abs_err + weights["Portfolio Error"] * port_err
+
+
+def pinball_loss(
+    pred_quantiles: dict[float, pd.DataFrame | pd.Series],
+    true: pd.DataFrame | pd.Series,
+) -> float:
+    """
+    Compute the pinball (quantile) loss of a probabilistic forecast.
+
+    Args:
+        pred_quantiles (dict): Maps each quantile level in (0, 1) to the
+            forecast of that quantile, with the same structure as `true`.
+        true (pd.DataFrame | pd.Series): Actual consumption.
+
+    Returns:
+        float: The pinball loss summed over consumers and hours, averaged over
+        quantile levels. For the median alone it is half the absolute error.
+    """
+    losses = []
+    for q, pred in pred_quantiles.items():
+        diff = np.asarray(true) - np.asarray(pred)
+        losses.append(np.maximum(q * diff, (q - 1) * diff).sum())
+    return float(np.mean(losses))
+
 
 def evaluate(
     pred_it: pd.DataFrame,
@@ -8,6 +73,10 @@ def evaluate(
     true_it: pd.DataFrame,
     true_es: pd.DataFrame,
     top_k: int = 3,  # Show top-k worst consumers
+    quantiles_it: dict[float, pd.DataFrame] | None = None,
+    quantiles_es: dict[float, pd.DataFrame] | None = None,
+    portfolio_quantiles_it: pd.DataFrame | None = None,
+    portfolio_quantiles_es: pd.DataFrame | None = None,
 ) -> pd.DataFrame:
     """
     Evaluate forecast accuracy and provide diagnostic information.
@@ -32,6 +101,15 @@ def evaluate(
             as `pred_es`.
         top_k (int, optional): The number of top consumers with the highest
             errors to display in the diagnostic report. Defaults to 3.
+        quantiles_it (dict, optional): Per-consumer quantile forecasts for
+            Italy, mapping each quantile level to a DataFrame shaped like
+            `true_it`. If given, the consumer-level pinball loss is reported.
+        quantiles_es (dict, optional): Same as `quantiles_it` for Spain.
+        portfolio_quantiles_it (pd.DataFrame, optional): Portfolio quantile
+            forecast for Italy, one column per quantile level, indexed like
+            `true_it`. If given, the portfolio pinball loss is reported.
+        portfolio_quantiles_es (pd.DataFrame, optional): Same as
+            `portfolio_quantiles_it` for Spain.
 
     Returns:
         pd.DataFrame: A scoring table summarizing the absolute and portfolio
@@ -50,6 +128,11 @@ def evaluate(
           - Absolute and portfolio errors for each country.
           - Weighted scores for Italy and Spain.
           - Top-k consumers with the highest errors for each country.
+          - Pinball losses, when quantile forecasts are given. They are
+            diagnostics only and do not enter the forecast score.
+        - Quantile forecasts from `ConformalQuantileModel` come from a point
+          model fitted without its calibration window (the latest history),
+          unless `refit=True`; compare point errors with that in mind.
           - The total forecast score.
 
     Example:
@@ -61,6 +144,7 @@ def evaluate(
     absolute_error = {}
     portfolio_error = {}
     consumer_errors = {}  # For diagnostic plots and tables
+    pinball_table = {}
 
     for country in ["ES", "IT"]:
         student_solution = pred_es if country == "ES" else pred_it
@@ -77,8 +161,7 @@ def evaluate(
         ), f"NaN in forecast for {country}"
 
         # Core errors
-        abs_err = (student_solution - testing_set).abs().sum().sum()
-        port_err = (student_solution - testing_set).sum(axis=1).abs().sum()
+        abs_err, port_err = country_errors(student_solution, testing_set)
 
         absolute_error[country] = abs_err
         portfolio_error[country] = port_err
@@ -87,21 +170,37 @@ def evaluate(
         consumer_abs_error = (student_solution - testing_set).abs().sum()
         consumer_errors[country] = consumer_abs_error.sort_values(ascending=False)
 
+        # Probabilistic errors
+        quantiles = quantiles_es if country == "ES" else quantiles_it
+        portfolio_quantiles = (
+            portfolio_quantiles_es if country == "ES" else portfolio_quantiles_it
+        )
+        pinball = {}
+        if quantiles is not None:
+            pinball["Absolute Pinball"] = pinball_loss(
+                {q: pred[testing_set.columns] for q, pred in quantiles.items()},
+                testing_set,
+            )
+        if portfolio_quantiles is not None:
+            pinball["Portfolio Pinball"] = pinball_loss(
+                dict(portfolio_quantiles.items()), testing_set.sum(axis=1)
+            )
+        pinball_table[country] = pd.Series(pinball, name="Score", dtype=float)
+
     # === Official scoring table ===
-    forecast_score = (
-        1.0 * absolute_error["IT"]
-        + 5.0 * absolute_error["ES"]
-        + 10.0 * portfolio_error["IT"]
-        + 50.0 * portfolio_error["ES"]
+    forecast_score = sum(
+        SCORE_WEIGHTS[country]["Absolute Error"] * absolute_error[country]
+        + SCORE_WEIGHTS[country]["Portfolio Error"] * portfolio_error[country]
+        for country in ["IT", "ES"]
     )
 
     score_table = pd.DataFrame(
         {"Absolute Error": absolute_error, "Portfolio Error": portfolio_error}
     ).T
 
-    score_table["Weight IT"] = [1.0, 10.0]  # IT weights
+    score_table["Weight IT"] = score_table.index.map(SCORE_WEIGHTS["IT"])
     score_table["Weighted IT"] = score_table["IT"] * score_table["Weight IT"]
-    score_table["Weight ES"] = [5.0, 50.0]  # ES weights
+    score_table["Weight ES"] = score_table.index.map(SCORE_WEIGHTS["ES"])
     score_table["Weighted ES"] = score_table["ES"] * score_table["Weight ES"]
     score_table = score_table[
         ["IT", "Weight IT", "Weighted IT", "ES", "Weight ES", "Weighted ES"]
@@ -123,12 +222,16 @@ def evaluate(
     print("IT PERFORMANCE")
     print("-" * 60 + "\n")
     print(score_it)
+    if not pinball_table["IT"].empty:
+        print("\n" + pinball_table["IT"].to_frame().to_string())
     print(f"\nTop {top_k} consumers with highest error in Italy:\n")
     print(consumer_errors["IT"].head(top_k).round(2).to_string())
 
     print("\nES PERFORMANCE")
     print("-" * 60 + "\n")
     print(score_es)
+    if not pinball_table["ES"].empty:
+        print("\n" + pinball_table["ES"].to_frame().to_string())
     print(f"\nTop {top_k} consumers with highest error in Spain:\n")
     print(consumer_errors["ES"].head(top_k).round(2).to_string())
 
@@ -136,3 +239,5 @@ def evaluate(
     print("TOTAL FORECAST SCORE".center(60))
     print(f"{int(round(forecast_score))}".center(60))
     print("-" * 60 + "\n")
+
+    return score_table
@@ -1,17 +1,19 @@
+from __future__ import annotations
+
 from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING
 
 import numpy as np
 import pandas as pd
 
-from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import TimeSeriesSplit
-
-from tqdm import tqdm
+# sklearn and tqdm take most of the import time, they are loaded on first use
+if TYPE_CHECKING:
+    from sklearn.model_selection import TimeSeriesSplit
 
 
 class Model(ABC):
     def __init__(self):
-        super().__init__(ABC)
+        super().__init__()
 
     @abstractmethod
     def fit(self, x: pd.DataFrame, y: pd.DataFrame) -> None:
@@ -84,7 +86,9 @@ class SimpleModel(Model):
     """
 
     def __init__(self):
-        super().__init__(Model)
+        from sklearn.linear_model import LinearRegression
+
+        super().__init__()
         self.linear_regression = LinearRegression()
 
     def fit(self, x: pd.DataFrame, y: pd.DataFrame) -> None:
@@ -98,6 +102,8 @@ class SimpleModel(Model):
         Input:
             split:  define a timeseries split (CV)
         """
+        from tqdm import tqdm
+
         losses_train = []
         losses_eval = []
 
@@ -121,3 +127,183 @@ class SimpleModel(Model):
 
     def predict(self, x):
         return self.linear_regression.predict(x)
+
+
+def conformal_quantile(values, quantiles: list[float]) -> np.ndarray:
+    """finite-sample (split conformal) quantiles of a 1d sample.
+
+    Upper levels q >= 0.5 take the ceil((n + 1) q)-th smallest value and lower
+    levels the floor((n + 1) q)-th, clipped to the sample, so that the bounds
+    are not narrower than the target coverage on small samples.
+
+    Input:
+        values: (n,) sample, e.g. calibration residuals
+        quantiles: levels in (0, 1)
+    Output:
+        (number_of_quantiles,) quantiles of the sample
+    """
+    values = np.sort(np.asarray(values, dtype=float))
+    n = len(values)
+    quantiles = np.asarray(quantiles, dtype=float)
+    rank = np.where(
+        quantiles >= 0.5,
+        np.ceil((n + 1) * quantiles),
+        np.floor((n + 1) * quantiles),
+    )
+    return values[np.clip(rank.astype(int), 1, n) - 1]
+
+
+class ConformalQuantileModel(Model):
+    """
+    Probabilistic wrapper around a point model (split conformal residuals).
+
+    The wrapped model is fitted once on the rows before the calibration
+    window; the residuals on the calibration window give every quantile at
+    once, so no model is trained per quantile. The window is either the last
+    `calibration_size` share of the rows or, to share it between consumers,
+    every row from `calibration_start` on.
+
+    By default the point model never sees the calibration window, which is
+    the most recent history, so its point forecast (and P50) can be weaker
+    than a fit on the full history. With `refit=True` the model is fitted
+    again on all rows once the residuals are computed; the residuals then
+    come from the split fit and are slightly conservative.
+    """
+
+    def __init__(
+        self,
+        model,
+        calibration_size: float = 0.2,
+        quantiles: list[float] = (0.1, 0.5, 0.9),
+        calibration_start: str = None,
+        refit: bool = False,
+    ):
+        super().__init__()
+        self.model = model
+        self.refit = refit
+        self.calibration_size = calibration_size
+        self.calibration_start = calibration_start
+        self.quantiles = list(quantiles)
+        self.residuals = None
+
+    def fit(self, x: pd.DataFrame, y: pd.DataFrame) -> None:
+        if self.calibration_start is not None:
+            calibration = np.asarray(x.index >= pd.to_datetime(self.calibration_start))
+        else:
+            n_calibration = max(1, int(len(x) * self.calibration_size))
+            calibration = np.arange(len(x)) >= len(x) - n_calibration
+        if calibration.all() or not calibration.any():
+            raise ValueError("Both the fit and calibration windows need rows.")
+
+        x_fit, x_cal = x[~calibration], x[calibration]
+        y_fit, y_cal = y[~calibration], y[calibration]
+
+        self.model.fit(x_fit, y_fit)
+        self.residuals = pd.Series(
+            np.asarray(y_cal).ravel() - np.asarray(self.model.predict(x_cal)).ravel(),
+            index=getattr(x_cal, "index", np.flatnonzero(calibration)),
+        )
+        if self.refit:
+            self.model.fit(x, y)
+
+    def train(self, x: pd.DataFrame, y: pd.DataFrame, split: TimeSeriesSplit):
+        """cross validation of the wrapped model, then refit and recalibrate.
+
+        The wrapped model is refitted on every fold, so `fit` is run again at
+        the end to keep the point forecast and the residuals consistent.
+        """
+        losses = self.model.train(x, y, split)
+        self.fit(x, y)
+        return losses
+
+    def predict(self, x_test: pd.DataFrame) -> np.ndarray:
+        return self.model.predict(x_test)
+
+    def predict_quantiles(
+        self, x_test: pd.DataFrame, quantiles: list[float] = None
+    ) -> pd.DataFrame:
+        """point forecast shifted by the residual quantiles.
+
+        Input:
+            x_test: (n, d) features of the forecast horizon
+            quantiles: levels in (0, 1), defaults to the ones given at init
+        Output:
+            (n, number_of_quantiles) forecast, a column is a quantile level
+        """
+        quantiles = self.quantiles if quantiles is None else list(quantiles)
+        point = np.asarray(self.predict(x_test))
+        shift = conformal_quantile(self.residuals, quantiles)
+        index = x_test.index if isinstance(x_test, pd.DataFrame) else None
+        return pd.DataFrame(
+            point[:, None] + shift[None, :], index=index, columns=quantiles
+        )
+
+
+def calibration_residuals(models: dict[str, ConformalQuantileModel]) -> pd.DataFrame:
+    """line up the calibration residuals of fitted models, one per client.
+
+    Input:
+        models: fitted models, the key is the client
+    Output:
+        (m, number_of_clients) residuals indexed by calibration hour, NaN
+        where a client has no residual for that hour
+    """
+    return pd.concat(
+        {client: model.residuals for client, model in models.items()}, axis=1
+    ).sort_index()
+
+
+def portfolio_quantiles(
+    point: pd.DataFrame,
+    residuals: pd.DataFrame,
+    quantiles: list[float] = (0.1, 0.5, 0.9),
+    by_hour: bool = True,
+    min_hour_count: int = 50,
+) -> pd.DataFrame:
+    """portfolio quantiles from the joint residuals of calibration hours.
+
+    The residuals of all clients are summed per calibration hour, so the
+    correlation between clients is kept in the portfolio spread. Hours where
+    a client has no residual are dropped rather than counted as zero, which
+    would narrow the spread. The quantiles use conformal ranks (see
+    `conformal_quantile`) and are computed per hour of day when `by_hour` and
+    both `residuals` and `point` are indexed by timestamps; hours of day with
+    fewer than `min_hour_count` calibration hours use the quantiles of all
+    hours.
+
+    Input:
+        point: (n, number_of_clients) point forecasts, a column is a client
+        residuals: (m, number_of_clients) calibration residuals (y - y_hat),
+            see `calibration_residuals`
+        quantiles: levels in (0, 1)
+    Output:
+        (n, number_of_quantiles) portfolio forecast, a column is a quantile
+    """
+    quantiles = list(quantiles)
+    residuals = residuals[point.columns].dropna()
+    if residuals.empty:
+        raise ValueError(
+            "No calibration hour has a residual for every client, "
+            "use a common `calibration_start`."
+        )
+    portfolio_residuals = residuals.sum(axis=1)
+    pooled = conformal_quantile(portfolio_residuals, quantiles)
+
+    if (
+        by_hour
+        and isinstance(residuals.index, pd.DatetimeIndex)
+        and isinstance(point.index, pd.DatetimeIndex)
+    ):
+        table = np.tile(pooled, (24, 1))
+        for hour, group in portfolio_residuals.groupby(residuals.index.hour):
+            if len(group) >= min_hour_count:
+                table[hour] = conformal_quantile(group, quantiles)
+        shift = table[point.index.hour]
+    else:
+        shift = np.broadcast_to(pooled, (len(point), len(quantiles)))
+
+    return pd.DataFrame(
+        point.sum(axis=1).to_numpy()[:, None] + shift,
+        index=point.index,
+        columns=quantiles,
+    )
@@ -2,24 +2,206 @@ import pickle
 import re
 from abc import ABC
 
-import holidays
 import numpy as np
 import pandas as pd
 
+CONSUMER_PATTERN = r"(IT|ES)_\d+"
+
+
+def _rolling_median(x: pd.DataFrame, window: int, min_periods: int) -> pd.DataFrame:
+    """Centered rolling median of every column, NaN aware."""
+    try:
+        import bottleneck as bn
+    except ImportError:  # pandas rolling is used instead, about 8x slower
+        return x.rolling(window, center=True, min_periods=min_periods).median()
+
+    # bottleneck only has trailing windows: pad the end and shift back
+    shift = window - 1 - window // 2
+    values = np.pad(
+        x.to_numpy(dtype=float), ((0, shift), (0, 0)), constant_values=np.nan
+    )
+    median = bn.move_median(values, window, min_count=min_periods, axis=0)
+    return pd.DataFrame(median[shift:], index=x.index, columns=x.columns)
+
+
+def _rolling_median_by_slot(
+    x: pd.DataFrame, period: int, window: int, min_periods: int
+) -> pd.DataFrame:
+    """
+    Centered rolling median over the same hour slot of consecutive periods.
+
+    The hourly frame is reshaped to (periods, period x consumers), so that a
+    single rolling median over the first axis handles every slot (hour of day
+    for `period=24`, weekday x hour for `period=168`) of every consumer.
+    """
+    start = x.index[0].normalize()
+    if period == 168:
+        start -= pd.Timedelta(days=start.dayofweek)
+    n_hours = int((x.index[-1] - start) / pd.Timedelta(hours=1)) + 1
+    n_periods = -(-n_hours // period)
+    grid = pd.date_range(start, periods=n_periods * period, freq="h")
+
+    values = x.reindex(grid).to_numpy(dtype=float)
+    by_period = pd.DataFrame(values.reshape(n_periods, -1))
+    median = _rolling_median(by_period, window, min_periods).to_numpy()
+    return pd.DataFrame(
+        median.reshape(len(grid), -1), index=grid, columns=x.columns
+    ).reindex(x.index)
+
+
+def detect_outliers(
+    x: pd.DataFrame,
+    threshold: float = 5.0,
+    profile_weeks: int = 12,
+    scale_days: int = 28,
+    scale_floor: float = 0.05,
+    return_scored: bool = False,
+) -> pd.DataFrame | tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Flag outliers of all consumers at once with a robust profile/MAD rule.
+
+    The expected value of an hour is the centered rolling median of the same
+    weekday and hour over `profile_weeks` weeks, so daily and weekly load
+    profiles are not mistaken for outliers. The scale is 1.4826 times the
+    rolling median absolute residual, taking the larger of the one of the
+    same weekday and hour (over `profile_weeks` weeks) and the one of the
+    same hour of day (over `scale_days` days, less noisy). It is floored at
+    `scale_floor` times the median of the non-zero values of the consumer,
+    so that consumers with mostly zero readings can still be checked. A value is an outlier when its residual
+    exceeds `threshold` scales. Consumers without any non-zero reading
+    (and hours without enough history) cannot be checked.
+
+    Args:
+        x (pd.DataFrame): Wide hourly frame, one column per consumer.
+        threshold (float, optional): Number of robust standard deviations.
+            Defaults to 5.0.
+        profile_weeks (int, optional): Rolling window of the profile, in
+            weeks. Defaults to 12.
+        scale_days (int, optional): Rolling window of the scale, in days.
+            Defaults to 28.
+        scale_floor (float, optional): Minimum scale, as a share of the median
+            non-zero value of each consumer. Defaults to 0.05.
+        return_scored (bool, optional): Also return the mask of observed
+            values that could be checked. Defaults to False.
+
+    Returns:
+        pd.DataFrame: Boolean mask with the structure of `x`, True for
+        outliers, and the mask of checked values if `return_scored`.
+    """
+    profile = _rolling_median_by_slot(
+        x, 168, profile_weeks, min_periods=max(1, profile_weeks // 2)
+    )
+    deviation = (x - profile).abs()
+    scale = 1.4826 * np.fmax(
+        _rolling_median_by_slot(
+            deviation, 168, profile_weeks, min_periods=max(1, profile_weeks // 2)
+        ),
+        _rolling_median_by_slot(
+            deviation, 24, scale_days, min_periods=max(1, scale_days // 4)
+        ),
+    )
+
+    floor = scale_floor * x.abs().where(x != 0).median()
+    scale = scale.clip(lower=floor, axis=1)
+    scale = scale.where(scale > 0)
+
+    mask = deviation > threshold * scale
+    if return_scored:
+        return mask, x.notna() & deviation.notna() & scale.notna()
+    return mask
+
+
+def outlier_summary(
+    x: pd.DataFrame, mask: pd.DataFrame, scored: pd.DataFrame | None = None
+) -> pd.DataFrame:
+    """
+    Summarise an outlier mask per consumer.
+
+    Args:
+        x (pd.DataFrame): Wide frame the mask was computed on.
+        mask (pd.DataFrame): Boolean mask as returned by `detect_outliers`.
+        scored (pd.DataFrame, optional): Mask of checked values, as returned
+            by `detect_outliers(..., return_scored=True)`.
+
+    Returns:
+        pd.DataFrame: One row per consumer with the number of observed
+        values, the number and share of outliers and the largest flagged
+        value, sorted by decreasing number of outliers. With `scored`, the
+        number of observed values that could not be checked (blind spots:
+        short history or no non-zero reading) is added as `n_unchecked`.
+    """
+    n_observed = x.notna().sum()
+    n_outliers = mask.sum()
+    summary = pd.DataFrame(
+        {
+            "n_observed": n_observed,
+            "n_outliers": n_outliers,
+            "share": n_outliers / n_observed.where(n_observed > 0),
+            "max_outlier": x.where(mask).max(),
+        }
+    )
+    if scored is not None:
+        summary["n_unchecked"] = n_observed - scored.sum()
+    return summary.sort_values("n_outliers", ascending=False)
+
 
 class PreProcessClass(ABC):
-    def __init__(self, x: pd.DataFrame, features: pd.DataFrame):
+    def __init__(
+        self,
+        x: pd.DataFrame,
+        features: pd.DataFrame,
+        outlier_threshold: float | None = None,
+    ):
         x.index = pd.to_datetime(x.index)
 
         features.index = pd.to_datetime(features.index)
         features = features[~features.index.duplicated(keep="first")]
         self.x = pd.concat([x, features], axis=1, join="outer")
         self.x = self.x[self.x.index < pd.to_datetime("2024-09-01")]
-        model_path = "model.pkl"
 
-        # Load the model
-        with open(model_path, "rb") as f:
-            self.model = pickle.load(f)
+        # Mask outliers so that they are imputed like missing values
+        self.outlier_report = None
+        if outlier_threshold is not None:
+            self.remove_outliers(outlier_threshold)
+
+        # The imputation model is loaded on first use, see `model`
+        self.model_path = "model.pkl"
+        self._model = None
+
+    @property
+    def model(self):
+        """Imputation model, unpickled (with lightgbm) the first time it is used."""
+        if self._model is None:
+            with open(self.model_path, "rb") as f:
+                self._model = pickle.load(f)
+        return self._model
+
+    def remove_outliers(self, threshold: float = 5.0, **kwargs) -> pd.DataFrame:
+        """
+        Replace the outliers of every consumer by NaN, in a single pass.
+
+        The masked values are then filled by the imputation model in
+        `preprocess`. The per-consumer summary is kept in `outlier_report`;
+        other keyword arguments are passed to `detect_outliers`.
+        """
+        consumers = [c for c in self.x.columns if re.search(CONSUMER_PATTERN, c)]
+        consumption = self.x[consumers]
+
+        mask, scored = detect_outliers(
+            consumption, threshold=threshold, return_scored=True, **kwargs
+        )
+        self.x[consumers] = consumption.mask(mask)
+        self.outlier_report = outlier_summary(consumption, mask, scored)
+
+        n_outliers = self.outlier_report["n_outliers"].sum()
+        n_observed = self.outlier_report["n_observed"].sum()
+        print(
+            f"Masked {n_outliers} outliers ({n_outliers / n_observed:.3%} of "
+            f"observed values) in {(self.outlier_report['n_outliers'] > 0).sum()} "
+            f"consumers, {self.outlier_report['n_unchecked'].sum()} values could "
+            "not be checked"
+        )
+        return self.outlier_report
 
     def preprocess_nonan(self, id: str) -> pd.DataFrame:
         """
@@ -31,6 +213,8 @@ class PreProcessClass(ABC):
                 raise ValueError(f"Customer ID '{i}' not found in the dataset.")
 
         if len(id) == 1:
+            import holidays
+
             if "ES" in id[0]:
                 # Use Spanish holidays
                 country_holidays = holidays.country_holidays("ES")
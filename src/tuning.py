@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+import itertools
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+
+from src.evaluate import weighted_score
+from src.preprocessing import CONSUMER_PATTERN
+
+# lightgbm is loaded on first use, it dominates the import time of this module
+if TYPE_CHECKING:
+    import lightgbm as lgb
+
+# Lags used by the per-consumer ForecasterRecursive in the notebook
+LAGS = [24, 168, 2 * 168]
+
+# Settings of the per-consumer LGBMRegressor in the notebook
+DEFAULT_PARAMS = {
+    "objective": "regression",
+    "learning_rate": 0.1,
+    "max_depth": 8,
+    "num_leaves": 40,
+    "subsample": 0.8,
+    "subsample_freq": 1,
+    "colsample_bytree": 0.8,
+    "reg_alpha": 0.5,
+    "reg_lambda": 0.5,
+    "random_state": 42,
+    "verbose": -1,
+}
+
+# Parameters fixed when a Dataset is binned; they cannot vary across candidates
+DATASET_PARAMS = {
+    "max_bin": 255,
+    "min_data_in_bin": 3,
+    "feature_pre_filter": False,
+    "verbose": -1,
+}
+
+GLOBAL_KEY = "__global__"
+
+
+def consumer_country(cust_id: str) -> str:
+    """Country ("IT" or "ES") of a consumer id, from its `IT_`/`ES_` prefix."""
+    match = re.search(CONSUMER_PATTERN, str(cust_id))
+    if match is None:
+        raise ValueError(f"Country not recognized for ID '{cust_id}'")
+    return match.group(1)
+
+
+def add_lag_features(df: pd.DataFrame, lags: list[int] = LAGS) -> pd.DataFrame:
+    """
+    Add lagged consumption columns to a long frame of consumers.
+
+    Each consumer is regularised to an hourly grid (forward filled, as in the
+    notebook) before shifting, so that `lag_24` is always the value 24 hours
+    earlier.
+
+    Args:
+        df (pd.DataFrame): Long frame indexed by timestamp, with a
+            `Consumption` column, an `id` column and exogenous features.
+        lags (list[int], optional): Lags in hours. Defaults to `LAGS`.
+
+    Returns:
+        pd.DataFrame: The frame with one `lag_<h>` column per lag; rows
+        without a full lag history are dropped.
+    """
+    frames = []
+    for cust_id, g in df.groupby("id"):
+        tmp_df = g.drop(columns=["id"]).asfreq("h").ffill()
+        for lag in lags:
+            tmp_df[f"lag_{lag}"] = tmp_df["Consumption"].shift(lag)
+        tmp_df["id"] = cust_id
+        frames.append(tmp_df.iloc[max(lags) :])
+    return pd.concat(frames)
+
+
+def build_datasets(
+    df: pd.DataFrame,
+    valid_start: str,
+    valid_end: str | None = None,
+    per_consumer: bool = True,
+    country: str | None = None,
+) -> dict[str, tuple[lgb.Dataset, pd.DataFrame, pd.DataFrame]]:
+    """
+    Bin the training data once so it can be shared by every candidate.
+
+    Args:
+        df (pd.DataFrame): Long frame as returned by `add_lag_features`.
+        valid_start (str): First timestamp of the validation window.
+        valid_end (str, optional): Last timestamp of the validation window.
+            Defaults to the end of the data.
+        per_consumer (bool, optional): Build one Dataset per consumer if True,
+            otherwise a single Dataset for a global model with `id` as a
+            categorical feature. Defaults to True.
+        country (str, optional): If set ("IT" or "ES"), only keep the
+            consumers of that country. Defaults to None (all consumers).
+
+    Returns:
+        dict: Maps the consumer id (or `GLOBAL_KEY`) to a tuple of the
+        constructed training Dataset, the validation features and the
+        validation targets (columns `id` and `Consumption`).
+    """
+    import lightgbm as lgb
+
+    df = df.copy()
+    countries = df["id"].map(consumer_country)
+    if country is not None:
+        df = df[countries == country]
+    df["id"] = df["id"].astype("category")
+    valid_mask = df.index >= pd.to_datetime(valid_start)
+    if valid_end is not None:
+        valid_mask &= df.index <= pd.to_datetime(valid_end)
+    train_df = df[df.index < pd.to_datetime(valid_start)]
+    valid_df = df[valid_mask]
+
+    if per_consumer:
+        groups = {
+            cust_id: (g.drop(columns=["id"]), valid_df[valid_df["id"] == cust_id])
+            for cust_id, g in train_df.groupby("id", observed=True)
+        }
+    else:
+        groups = {GLOBAL_KEY: (train_df, valid_df)}
+
+    datasets = {}
+    for key, (train, valid) in groups.items():
+        if len(valid) == 0:
+            continue
+        dataset = lgb.Dataset(
+            train.drop(columns=["Consumption"]),
+            label=train["Consumption"],
+            params=DATASET_PARAMS,
+            free_raw_data=False,
+        ).construct()
+        x_valid = valid.drop(columns=["Consumption"])
+        if per_consumer:
+            x_valid = x_valid.drop(columns=["id"])
+        datasets[key] = (dataset, x_valid, valid[["id", "Consumption"]])
+    return datasets
+
+
+def sample_candidates(
+    param_grid: dict[str, list], n_candidates: int | None = None, seed: int = 42
+) -> list[dict]:
+    """
+    Expand a parameter grid into a list of candidate settings.
+
+    Args:
+        param_grid (dict): Maps LightGBM parameter names to candidate values.
+        n_candidates (int, optional): If set, sample this many settings from
+            the full grid without replacement. Defaults to None (full grid).
+        seed (int, optional): Seed of the sampler. Defaults to 42.
+
+    Returns:
+        list[dict]: Candidate parameters, each merged over `DEFAULT_PARAMS`.
+    """
+    fixed = set(param_grid) & set(DATASET_PARAMS)
+    if fixed:
+        raise ValueError(
+            f"Parameters {sorted(fixed)} are fixed by the Dataset binning."
+        )
+    keys = list(param_grid)
+    grid = [
+        dict(zip(keys, values)) for values in itertools.product(*param_grid.values())
+    ]
+    if n_candidates is not None and n_candidates < len(grid):
+        rng = np.random.default_rng(seed)
+        grid = [grid[i] for i in rng.choice(len(grid), n_candidates, replace=False)]
+    return [{**DEFAULT_PARAMS, **params} for params in grid]
+
+
+def _fit_predict(
+    params: dict,
+    num_boost_round: int,
+    dataset: lgb.Dataset,
+    x_valid: pd.DataFrame,
+    booster: lgb.Booster | None = None,
+) -> tuple[lgb.Booster, np.ndarray]:
+    """Train a booster up to `num_boost_round`, continuing `booster` if given."""
+    import lightgbm as lgb
+
+    if booster is None:
+        booster = lgb.train(
+            {**params, "num_threads": 1},
+            dataset,
+            num_boost_round=num_boost_round,
+            keep_training_booster=True,
+        )
+    else:
+        # update() adds trees in place; lgb.train(init_model=...) would instead
+        # set init scores on the Dataset shared by all threads
+        for _ in range(num_boost_round - booster.current_iteration()):
+            booster.update()
+    return booster, booster.predict(x_valid)
+
+
+def score_candidate(
+    predictions: dict[str, np.ndarray],
+    datasets: dict[str, tuple[lgb.Dataset, pd.DataFrame, pd.DataFrame]],
+) -> float:
+    """
+    Score the validation predictions of one candidate with the official metric.
+
+    As in `evaluate`, each country is scored with its own weights, the
+    country of a consumer being read from its id, and the scores are summed.
+
+    Args:
+        predictions (dict): Maps each key of `datasets` to its predictions.
+        datasets (dict): As returned by `build_datasets`.
+
+    Returns:
+        float: The weighted score summed over countries (lower is better).
+    """
+    pred_long, true_long = [], []
+    for key, (_, _, y_valid) in datasets.items():
+        pred = y_valid.assign(Consumption=np.clip(predictions[key], 0, None))
+        pred_long.append(pred)
+        true_long.append(y_valid)
+    pred_wide = pd.concat(pred_long).pivot(columns="id", values="Consumption")
+    true_wide = pd.concat(true_long).pivot(columns="id", values="Consumption")
+    pred_wide, true_wide = pred_wide.fillna(0), true_wide.fillna(0)
+
+    countries = true_wide.columns.map(consumer_country)
+    return sum(
+        weighted_score(
+            pred_wide.loc[:, countries == country],
+            true_wide.loc[:, countries == country],
+            country,
+        )
+        for country in sorted(set(countries))
+    )
+
+
+def successive_halving(
+    datasets: dict[str, tuple[lgb.Dataset, pd.DataFrame, pd.DataFrame]],
+    candidates: list[dict],
+    min_rounds: int = 25,
+    max_rounds: int = 400,
+    eta: int = 3,
+    n_jobs: int | None = None,
+) -> pd.DataFrame:
+    """
+    Tune LightGBM settings with successive halving on shared Datasets.
+
+    All candidates are first trained with `min_rounds` boosting rounds and
+    scored with `score_candidate` on the validation window. Only the best
+    `1 / eta` of them are kept for the next rung, whose budget is multiplied
+    by `eta`, until one candidate is left or `max_rounds` is reached. The
+    boosters of the survivors are kept and continued, so a rung only trains
+    the trees that the previous rungs have not built yet.
+    Training runs in a thread pool: LightGBM releases the GIL and the binned
+    Datasets are shared between threads instead of being rebuilt.
+
+    Note that validation uses the observed lags, not recursive predictions,
+    so scores are optimistic; they are meant for ranking candidates.
+
+    Args:
+        datasets (dict): As returned by `build_datasets`.
+        candidates (list[dict]): As returned by `sample_candidates`.
+        min_rounds (int, optional): Boosting rounds of the first rung.
+            Defaults to 25.
+        max_rounds (int, optional): Maximum boosting rounds. Defaults to 400.
+        eta (int, optional): Reduction factor between rungs. Defaults to 3.
+        n_jobs (int, optional): Number of worker threads. Defaults to the
+            number of CPUs.
+
+    Returns:
+        pd.DataFrame: One row per (candidate, rung) with the candidate index,
+        the number of boosting rounds, the score and the parameters, sorted
+        so that the first row is the best setting of the last rung.
+    """
+    n_jobs = n_jobs or os.cpu_count()
+    survivors = list(range(len(candidates)))
+    num_boost_round = min_rounds
+    boosters = {}
+    rows = []
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        while True:
+            futures = {
+                (i, key): executor.submit(
+                    _fit_predict,
+                    candidates[i],
+                    num_boost_round,
+                    dataset,
+                    x_valid,
+                    boosters.get((i, key)),
+                )
+                for i in survivors
+                for key, (dataset, x_valid, _) in datasets.items()
+            }
+            scores = {}
+            for i in survivors:
+                predictions = {}
+                for key in datasets:
+                    boosters[(i, key)], predictions[key] = futures[(i, key)].result()
+                scores[i] = score_candidate(predictions, datasets)
+                rows.append(
+                    {
+                        "candidate": i,
+                        "num_boost_round": num_boost_round,
+                        "score": scores[i],
+                        "params": candidates[i],
+                    }
+                )
+            print(
+                f"{num_boost_round} rounds: best score "
+                f"{min(scores.values()):.2f} over {len(survivors)} candidates"
+            )
+
+            if len(survivors) == 1 or num_boost_round >= max_rounds:
+                break
+            n_keep = max(1, len(survivors) // eta)
+            survivors = sorted(survivors, key=scores.get)[:n_keep]
+            boosters = {
+                (i, key): booster
+                for (i, key), booster in boosters.items()
+                if i in survivors
+            }
+            num_boost_round = min(num_boost_round * eta, max_rounds)
+
+    results = pd.DataFrame(rows)
+    return results.sort_values(
+        ["num_boost_round", "score"], ascending=[False, True]
+    ).reset_index(drop=True)
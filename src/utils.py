@@ -1,8 +1,6 @@
 import numpy as np
 import pandas as pd
 
-from sklearn.model_selection import TimeSeriesSplit
-
 
 def train_test_split_data(x: pd.DataFrame, y: pd.DataFrame, kfolds: int = 5):
     pass